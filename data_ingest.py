@@ -8,18 +8,17 @@ Verbose ingestion script for Flight Analytics.
 """
 
 import os
-import time
 import traceback
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from db import init_db, SessionLocal, Airport, Aircraft, Flight, AirportDelay
-# utils.get_airport_by_iata may raise or return unexpected shapes; call inside try/except
+from db import init_db, refresh_summary_tables, SessionLocal, Airport, Aircraft, Flight, AirportDelay
+# utils.get_client may raise or return unexpected shapes; call inside try/except
 try:
-    from utils import get_airport_by_iata
+    from utils import get_client
 except Exception:
-    get_airport_by_iata = None
+    get_client = None
 
 # Debug printing helper
 def log(*args, **kwargs):
@@ -95,18 +94,31 @@ def insert_demo_data(session):
 
 def try_fetch_airports_from_api(iata_list, session):
     """
-    Try to fetch airports via utils.get_airport_by_iata.
+    Fetch all airports concurrently via get_client().get_multiple_airports,
+    then insert them sequentially on the session.
     Returns True if at least one insert succeeded, False otherwise.
     """
-    if get_airport_by_iata is None:
-        log("No get_airport_by_iata function available (utils import failed). Skipping API ingestion.")
+    if get_client is None:
+        log("No API client available (utils import failed). Skipping API ingestion.")
+        return False
+
+    # fetch all airports concurrently (the calls are independent I/O),
+    # then insert sequentially on the single DB session
+    log(f"Fetching {len(iata_list)} airports from API concurrently...")
+    try:
+        payloads = get_client().get_multiple_airports(iata_list, max_workers=4)
+    except Exception as e:
+        log("Batch API fetch failed:", e)
+        traceback.print_exc()
         return False
 
     any_inserted = False
     for iata in iata_list:
-        log(f"Fetching {iata} from API...")
+        data = payloads.get(iata)
+        if data is None:
+            log(f"No API data for {iata} — skipping.")
+            continue
         try:
-            data = get_airport_by_iata(iata)
             # robust extraction: handle dict values for country/continent
             def scalar(x):
                 if x is None:
@@ -153,7 +165,6 @@ def try_fetch_airports_from_api(iata_list, session):
             session.commit()
             log(f"Inserted airport {iata_code} from API.")
             any_inserted = True
-            time.sleep(0.2)  # be polite with rate limits
 
         except Exception as e:
             session.rollback()
@@ -205,6 +216,15 @@ def main():
     # Print final counts and exit
     print_counts(session)
     session.close()
+
+    # rebuild the dashboard's materialized aggregates so the leaderboards
+    # see the rows this run inserted instead of stale summaries
+    try:
+        refresh_summary_tables()
+        log("Summary tables refreshed.")
+    except Exception as e:
+        log("Summary refresh failed:", e)
+
     log("Ingestion script finished.")
 
 if __name__ == "__main__":
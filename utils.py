@@ -1,10 +1,40 @@
 # utils.py
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from db import SessionLocal, Airport, Aircraft, Flight, AirportDelay
 from sqlalchemy.exc import IntegrityError
 import time
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+# orjson decodes raw bytes noticeably faster than stdlib json; fall back
+# to json.loads when it isn't installed
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    _loads = json.loads
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+# only advertise brotli when urllib3 can actually decode it (it checks
+# for the same modules); advertising 'br' without a decoder makes the
+# server send bytes we'd hand to the JSON parser still compressed
+try:
+    try:
+        import brotlicffi as _brotli  # noqa: F401
+    except ImportError:
+        import brotli as _brotli  # noqa: F401
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    _ACCEPT_ENCODING = "gzip, deflate"
 
 load_dotenv()
 API_KEY = os.getenv("RAPIDAPI_KEY")
@@ -16,11 +46,245 @@ HEADERS = {
 
 BASE_URL = f"https://{API_HOST}"
 
+CACHE_TTL = 300  # seconds a cached API payload stays fresh
+CACHE_SWEEP_INTERVAL = 60   # seconds between background expiry sweeps
+CACHE_MAX_ENTRIES = 1024    # per-shard size cap before LRU-by-expiry eviction
+CACHE_DB_PATH = os.getenv("API_CACHE_PATH", ".api_cache.sqlite")
+
+class FlightAPIClient:
+    """
+    Small wrapper around the AeroDataBox REST API.
+    Keeps a single requests.Session (keep-alive + connection pool) so the
+    TCP/TLS handshake is paid once per process instead of once per call.
+    """
+    def __init__(self, api_key=None, api_host=None, pool_size=8):
+        self.api_key = api_key or API_KEY
+        self.api_host = api_host or API_HOST
+        self.base_url = f"https://{self.api_host}"
+        self.session = requests.Session()
+        self.session.headers.update({
+            "x-rapidapi-key": self.api_key,
+            "x-rapidapi-host": self.api_host,
+            # ask for compressed payloads explicitly; flight schedules can
+            # be hundreds of KB of JSON and gzip typically shrinks 5-10x
+            "Accept-Encoding": _ACCEPT_ENCODING
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        # cached "today" string, refreshed only when the UTC day rolls over
+        self._today_str = None
+        self._today_epoch_day = -1
+        # request/error counters; += on a plain dict is not atomic when
+        # called from worker threads, so guard the Counter with a lock
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        # response cache sharded per endpoint family, keyed by the short
+        # code (IATA / flight number) instead of the full URL: smaller
+        # dicts per shard and clear/sweep can work one family at a time
+        self._cache = {"airport": {}, "flight": {}}
+        self._cache_lock = threading.Lock()
+        # on-disk cache so a restarted process starts warm instead of
+        # re-hitting the API for everything; same TTL as the memory tier
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        try:
+            self._disk = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache "
+                "(key TEXT PRIMARY KEY, expires REAL, payload BLOB)"
+            )
+            self._disk.commit()
+        except sqlite3.Error:
+            self._disk = None
+        # periodic sweeper so expired entries are reclaimed even if they
+        # are never touched again (check-on-access alone leaks dead keys)
+        self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True)
+        self._sweeper.start()
+        self._warm_connection()
+
+    def _warm_connection(self):
+        # Cheap preflight so the first real request reuses an already
+        # established keep-alive connection instead of paying the full
+        # TLS handshake. Errors here are harmless — just skip the warmup.
+        try:
+            self.session.head(self.base_url, timeout=5)
+        except requests.RequestException:
+            pass
+
+    def _today(self):
+        # strftime walks tz data and allocates on every call; only redo it
+        # when the epoch day actually changes.
+        day = int(time.time() // 86400)
+        if day != self._today_epoch_day:
+            self._today_str = datetime.utcnow().strftime("%Y-%m-%d")
+            self._today_epoch_day = day
+        return self._today_str
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _get_json(self, url):
+        self._bump("requests")
+        try:
+            r = self.session.get(url, timeout=20)
+            r.raise_for_status()
+        except requests.RequestException:
+            self._bump("errors")
+            raise
+        # track how much the transfer encoding saved us on the wire
+        try:
+            wire_len = int(r.headers.get("Content-Length", 0) or 0)
+            body_len = len(r.content)
+            if wire_len and body_len > wire_len:
+                self._bump("bytes_saved", body_len - wire_len)
+        except (TypeError, ValueError):
+            pass
+        # decode the raw bytes once instead of r.json()'s str-decode pass
+        return _loads(r.content)
+
+    @staticmethod
+    def _disk_key(kind, key):
+        return f"{kind}:{key}"
+
+    def _disk_get(self, kind, key):
+        if self._disk is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT expires, payload FROM api_cache WHERE key = ?",
+                    (self._disk_key(kind, key),)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row and time.time() < row[0]:
+            return row[0], _loads(row[1])
+        return None
+
+    def _disk_put(self, kind, key, expires, value):
+        if self._disk is None:
+            return
+        try:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO api_cache (key, expires, payload) VALUES (?,?,?)",
+                    (self._disk_key(kind, key), expires, _dumps(value))
+                )
+                self._disk.commit()
+        except sqlite3.Error:
+            pass
+
+    def _cache_get(self, kind, key):
+        with self._cache_lock:
+            entry = self._cache[kind].get(key)
+            if entry is not None:
+                expires, value = entry
+                if time.time() < expires:
+                    self._bump("cache_hits")
+                    return value
+                del self._cache[kind][key]
+        # memory miss: maybe a previous process already fetched it
+        disk_entry = self._disk_get(kind, key)
+        if disk_entry is not None:
+            expires, value = disk_entry
+            with self._cache_lock:
+                self._cache[kind][key] = (expires, value)
+            self._bump("disk_hits")
+            return value
+        self._bump("cache_misses")
+        return None
+
+    def _cache_put(self, kind, key, value, ttl=CACHE_TTL):
+        expires = time.time() + ttl
+        with self._cache_lock:
+            self._cache[kind][key] = (expires, value)
+        self._disk_put(kind, key, expires, value)
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(CACHE_SWEEP_INTERVAL)
+            self._sweep_expired()
+
+    def _sweep_expired(self):
+        now = time.time()
+        with self._cache_lock:
+            for shard in self._cache.values():
+                for key, (expires, _) in list(shard.items()):
+                    if now >= expires:
+                        shard.pop(key, None)
+                excess = len(shard) - CACHE_MAX_ENTRIES
+                if excess > 0:
+                    # evict entries closest to expiry first
+                    doomed = sorted(shard, key=lambda k: shard[k][0])[:excess]
+                    for key in doomed:
+                        shard.pop(key, None)
+                    self._bump("cache_evictions", excess)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            for shard in self._cache.values():
+                shard.clear()
+
+    def get_airport_by_iata(self, iata):
+        cached = self._cache_get("airport", iata)
+        if cached is not None:
+            return cached
+        data = self._get_json(f"{self.base_url}/airports/iata/{iata}")
+        self._cache_put("airport", iata, data)
+        return data
+
+    def get_flight_status(self, flight_number, date=None):
+        """Status of a flight number for a given date (default: today UTC)."""
+        day = date or self._today()
+        key = (flight_number, day)
+        cached = self._cache_get("flight", key)
+        if cached is not None:
+            return cached
+        data = self._get_json(f"{self.base_url}/flights/number/{flight_number}/{day}")
+        self._cache_put("flight", key, data)
+        return data
+
+    def get_multiple_airports(self, iata_codes, max_workers=8):
+        """
+        Fetch several airports concurrently.
+        Returns {iata: payload-or-None}. URLs are built up front in the
+        caller thread so workers do no string formatting — they only run
+        the network call and JSON decode.
+        """
+        results = {}
+        jobs = []
+        for code in iata_codes:
+            cached = self._cache_get("airport", code)
+            if cached is not None:
+                results[code] = cached
+            else:
+                jobs.append((code, f"{self.base_url}/airports/iata/{code}"))
+        if not jobs:
+            return results
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(self._get_json, url): code for code, url in jobs}
+            for fut in as_completed(futures):
+                code = futures[fut]
+                try:
+                    results[code] = fut.result()
+                    self._cache_put("airport", code, results[code])
+                except Exception:
+                    results[code] = None
+        return results
+
+# lazy singleton so importing utils never opens a network connection
+_default_client = None
+
+def get_client():
+    global _default_client
+    if _default_client is None:
+        _default_client = FlightAPIClient()
+    return _default_client
+
 def get_airport_by_iata(iata):
-    url = f"{BASE_URL}/airports/iata/{iata}"
-    r = requests.get(url, headers=HEADERS, timeout=20)
-    r.raise_for_status()
-    return r.json()
+    return get_client().get_airport_by_iata(iata)
 
 def get_flights_for_airport(iata, days=3, direction="arrival"):
     """